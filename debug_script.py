@@ -12,4 +12,6 @@ test_output_dir = (
     'debug_data/debug_data_output'
 )
 
-reformat_exp_data.reformat_data(test_input_dir, test_output_dir)
+# the guard is needed since reformat_data uses multiple processes
+if __name__ == '__main__':
+    reformat_exp_data.reformat_data(test_input_dir, test_output_dir)
@@ -2,7 +2,7 @@
 # PACKAGE IMPORTS
 # =======================================
 # python built-in packages
-import bisect
+from concurrent.futures import ProcessPoolExecutor
 import os
 
 # 3rd party packages
@@ -17,38 +17,327 @@ from custom_errors import (
     MissingColumnException,
 )
 
+# =======================================
+# DEFINE CONSTANTS
+# =======================================
+# names of the HDF5 'MessageEvent' dataset fields that are used when
+# inserting messages into the eyetracker data. (all of the eyetracker
+# sample fields are included in the output, and so are all read)
+MESSAGE_FIELD_NAMES = ('time', 'text')
+
+# define list of 'core PsychoPy' experiment output data columns 
+# that are of interest for combining with/inserting into the
+# eyetracker data frame (see reformat_data_pair below)
+CORE_INTERESTING_COLNAMES = [
+    'att_grab_start_time_intended',
+    'gaze_to_audio_delay_intended',
+    'audio_to_visual_delay_intended',
+    'visual_duration_intended',
+    'end_blank_duration_intended',
+    'att_grab_start_time_actual',
+    'gaze_captured_time',
+    'audio_onset_time',
+    'visual_onset_time',
+    'visual_offset_time',
+    'trial_end_time',
+    'attention_sounds_played',
+    'visual_stimuli_duration_nframes',
+    'visual_social_prop',
+    'visual_geometric_prop',
+    'visual_manmade_prop',
+    'visual_natural_prop',
+    'visual_social_filepath',
+    'visual_social_pos_x',
+    'visual_social_pos_y',
+    'visual_geometric_filepath',
+    'visual_geometric_pos_x',
+    'visual_geometric_pos_y',
+    'visual_manmade_filepath',
+    'visual_manmade_pos_x',
+    'visual_manmade_pos_y',
+    'visual_natural_filepath',
+    'visual_natural_pos_x',
+    'visual_natural_pos_y',
+    'audio_filepath',
+    'audio_volume',
+]
+
+# size (in bytes) and number of hash table slots (a prime number) of 
+# the HDF5 chunk cache. the default cache (1 MiB) is too small to hold
+# the chunks of a typical eyetracker dataset, meaning chunks would be
+# repeatedly evicted and reread from disk
+H5_CHUNK_CACHE_NBYTES = 64 * 1024 * 1024
+H5_CHUNK_CACHE_NSLOTS = 1048573
+
+# maximum total size (in bytes) of HDF5 files that are loaded 
+# into memory in their entirety before being read. when several
+# processes are used, this is split evenly between them
+H5_CORE_DRIVER_MAX_NBYTES = 512 * 1024 * 1024
+
+# formats that reformatted data can be output in
+OUTPUT_FORMATS = ('csv', 'parquet')
+
 # =======================================
 # DEFINE HELPER FUNCTIONS
 # =======================================
-# function that goes through an **already sorted** array-like 
-# data structure and finds the index of the element that 
-# is closest to a passed numeric value
-def find_closest_index(sorted_arr, search_val):
-    # use the built-in library bisect's binary search function
-    # to find the index where the input value would be inserted
-    # in order to keep the array sorted
-    insert_index = bisect.bisect(sorted_arr, search_val)
-    # if the search value is greater than the highest value
-    # in the array, return the highest index of the array
-    if len(sorted_arr) == insert_index:
-        return insert_index - 1
-    # if the search value is less than the least value
-    # in the array, return index 0
-    if insert_index == 0:
-        return 0
-    # check which value is the closest to 'search_val' out of the value
+# function that goes through an **already sorted** array
+# and, for each value in another array of numeric values,
+# finds the index of the element that is closest to it
+def find_closest_indices(sorted_arr, search_vals):
+    # use numpy's binary search function to find, for all search
+    # values at once, the indices where they would be inserted
+    # in order to keep the array sorted (side='right' means that
+    # values equal to an array element are placed after it)
+    insert_indices = np.searchsorted(sorted_arr, search_vals, side='right')
+    # clip the insertion indices so that there is always a value
+    # right before and right after each 'insertion index slot'
+    after_indices = np.clip(insert_indices, 1, len(sorted_arr) - 1)
+    before_indices = after_indices - 1
+    # check which value is the closest to each search value out of the value
     # right before the 'insertion index slot', or right after
-    # it. if there is a tie, return the lower of the two indexes.
-    before_dist = abs(sorted_arr[insert_index-1] - search_val)
-    after_dist = abs(sorted_arr[insert_index] - search_val)
-    if after_dist < before_dist:
-        return insert_index
+    # it. if there is a tie, use the lower of the two indexes.
+    before_dists = np.abs(sorted_arr[before_indices] - search_vals)
+    after_dists = np.abs(sorted_arr[after_indices] - search_vals)
+    closest_indices = np.where(
+        after_dists < before_dists, after_indices, before_indices
+    )
+    # if a search value is less than the least value
+    # in the array, use index 0
+    closest_indices[insert_indices == 0] = 0
+    # if a search value is greater than the highest value
+    # in the array, use the highest index of the array
+    closest_indices[insert_indices == len(sorted_arr)] = len(sorted_arr) - 1
+    return closest_indices
+
+
+
+# function that reads a full h5py dataset into a numpy array,
+# optionally including only a subset of its (compound dtype) fields
+def read_dataset(dataset, field_names=None):
+    # if only some fields are of interest, have h5py read just those,
+    # rather than reading all of the data and then discarding most of it
+    if field_names is not None:
+        return dataset.fields(list(field_names))[()]
+    # read the data directly into a preallocated array, which avoids
+    # the overhead of h5py's general slicing machinery 
+    # (see https://github.com/h5py/h5py/issues/977)
+    arr = np.empty(dataset.shape, dtype=dataset.dtype)
+    # reading directly into an array fails for empty datasets
+    # and for some unusual compound dtypes, in which case
+    # h5py's regular reading is used instead
+    try:
+        dataset.read_direct(arr)
+    except (TypeError, ValueError):
+        arr = dataset[()]
+    return arr
+
+
+
+def reformat_data_pair(
+    exp_data_dir,
+    output_dir,
+    csv_fname,
+    et_hdf5_fname,
+    output_format='csv',
+    core_driver_max_nbytes=H5_CORE_DRIVER_MAX_NBYTES,
+):
+    """
+    Reformats the data output of a single experiment run, ie one 
+    'core PsychoPy' CSV file and its corresponding HDF5 file, by 
+    slightly correcting and combining their data, then exporting 
+    the results to one CSV (or Parquet) file.
+    :param exp_data_dir: Full path to raw experiment output directory.
+    :param output_dir: Full path to directory to output reformatted
+    data to.
+    :param csv_fname: Name of the experiment run's CSV file.
+    :param et_hdf5_fname: Name of the experiment run's HDF5 file.
+    :param output_format: Format to output reformatted data in, either
+    'csv' or 'parquet' (the latter requires pyarrow).
+    :param core_driver_max_nbytes: Maximum size (in bytes) of an HDF5
+    file for it to be loaded into memory in its entirety before being read.
+    """
+    et_hdf5_path = os.path.join(exp_data_dir, et_hdf5_fname)
+    csv_path = os.path.join(exp_data_dir, csv_fname)
+
+    # =======================================
+    # EXTRACT EYETRACKER DATA WITH H5PY
+    # =======================================
+    # load small enough HDF5 files into memory in one go using the
+    # 'core' driver, so that datasets are then read from memory, and
+    # otherwise use the default driver with a tuned chunk cache
+    try:
+        if os.path.getsize(et_hdf5_path) < core_driver_max_nbytes:
+            h5f = h5py.File(
+                et_hdf5_path, 'r', driver='core', backing_store=False
+            )
+        else:
+            h5f = h5py.File(
+                et_hdf5_path,
+                'r',
+                rdcc_nbytes=H5_CHUNK_CACHE_NBYTES,
+                rdcc_nslots=H5_CHUNK_CACHE_NSLOTS,
+                rdcc_w0=1.0,
+            )
+    except OSError as e:
+        raise CorruptHDF5Exception(
+            f"HDF5 file '{et_hdf5_path}' appears to be corrupt and cannot "
+            'be processed.'
+            f'(original exception: {e})'
+        )
+
+    # use the opened file as a context manager, so that the connection
+    # to it is closed once the data have been read, even if an 
+    # error is raised
+    with h5f:
+        h5f_events = h5f['data_collection']['events']
+        h5f_eyetracker = h5f_events['eyetracker']
+        # get the names of all eyetracker datasets once, rather
+        # than looking them up for each check below
+        h5f_eyetracker_keys = set(h5f_eyetracker.keys())
+        # traverse hierarchical data structure to get at eye tracking data.
+        # check if 'mock' (using the mouse to simulate eyetracker gaze recording) 
+        # data are used (in which case 'monocular' events
+        # have been registered), or if actual data are used 
+        # (in which case 'BinocularEyeSampleEvent' have been registered,
+        # usually)
+        if 'BinocularEyeSampleEvent' in h5f_eyetracker_keys:
+            eye_dataset = h5f_eyetracker['BinocularEyeSampleEvent']
+        elif 'MonocularEyeSampleEvent' in h5f_eyetracker_keys:
+            eye_dataset = h5f_eyetracker['MonocularEyeSampleEvent']
+        else:
+            raise CorruptHDF5Exception(
+                f'HDF5 file {et_hdf5_path} appears to be corrupt and cannot '
+                'be processed.'
+            )
+        # traverse hierarchical data structure to get at data describing messages
+        # 'sent from PsychoPy', eg 'trial start' messages
+        message_dataset = h5f_events['experiment']['MessageEvent']
+
+        # convert eyetracker/message data to numpy arrays
+        eye_data_arr = read_dataset(eye_dataset)
+        message_data_arr = read_dataset(message_dataset, MESSAGE_FIELD_NAMES)
+
+    # convert the eyetracker data numpy array to a pandas data frame
+    et_df = pd.DataFrame(eye_data_arr)
+    # get the eyetracker data times as a numpy array once, 
+    # for use in the calculations below
+    et_time_arr = et_df['time'].to_numpy()
+    # convert 'messages' data numpy array to pandas data frame,
+    # converting the messages from 'byte' dtype to string literal 
+    # dtype (doing this with numpy, on the whole array at once)
+    msg_df = pd.DataFrame({
+        'time': message_data_arr['time'],
+        'text': np.char.decode(message_data_arr['text'], 'utf-8'),
+    })
+
+    # for each recorded message, find the row in the 'et_df' which matches 
+    # most closely with regard to time of recording
+    closest_indices = find_closest_indices(
+        et_time_arr, msg_df['time'].to_numpy()
+    )
+    # form a 'message' column for the eyetracker data frame (it's added
+    # to the data frame further below), and insert the messages 
+    # into it at the matching rows
+    message_arr = np.full(len(et_df), None, dtype=object)
+    message_arr[closest_indices] = msg_df['text'].to_numpy()
+    et_messages = pd.Series(message_arr, index=et_df.index, name='message')
+
+    # =======================================
+    # LOAD 'CORE PSYCHOPY' EXPERIMENT DATA
+    # =======================================
+    # import psychopy experiment output data
+    # (stimuli onset times/file names/positions et c.),
+    # only parsing the columns that are actually used
+    required_colnames = set(CORE_INTERESTING_COLNAMES)
+    required_colnames.add('trial_global_start_time')
+    psyp_df = pd.read_csv(
+        csv_path, usecols=lambda coln: coln in required_colnames
+    )
+
+    # check if all of the necessary data columns are
+    # in the CSV file, and otherwise raise an error
+    # listing all of the missing columns
+    missing_colnames = required_colnames - set(psyp_df.columns)
+    if missing_colnames:
+        missing_colnames_str = ', '.join(
+            f"'{coln}'" for coln in sorted(missing_colnames)
+        )
+        raise MissingColumnException((
+            f"Missing column(s) in CSV file '{csv_path}':\n"
+            f"Could not find required column(s) {missing_colnames_str}. "
+            "Please double-check the data. "
+            "If it's not possible to correct the CSV file, "
+            "please move it, and its corresponding HDF5 file, "
+            "to another directory and rerun the reformatting."
+        ))
+
+    # =======================================
+    # ADJUST EYETRACKER DATA TIMES
+    # =======================================
+    # find all correctly registered trial start times from CSV file
+    psyp_stime_mask = psyp_df.trial_global_start_time.notna()
+    psyp_first_trial_start_times = (
+        psyp_df.loc[psyp_stime_mask, 'trial_global_start_time'].to_numpy()
+    )
+    # find all correctly registered trial start times from eyetracker/HDF5 file
+    # (these are indicated by 'trial <trial_number> start' messages sent from PsychoPy to the
+    # submodule handling the eyetracker)
+    # (all such messages start with 'exp1 trial ', so first use a cheap
+    # check for that, and then apply the full regex only to matching rows)
+    et_tmsg_indices = np.flatnonzero(
+        et_messages.str.startswith('exp1 trial ', na=False).to_numpy(dtype=bool)
+    )
+    # get an array of indices for 'trial start' rows in et_df (et_df
+    # has a default integer index, so row positions and labels match)
+    et_tstart_indices = et_tmsg_indices[
+        et_messages.iloc[et_tmsg_indices]
+        .str.match(r'exp1 trial \d+ start')
+        .to_numpy(dtype=bool)
+    ]
+    et_first_trial_start_times = et_time_arr[et_tstart_indices]
+    # find the average offset between: 
+    # * trial start times as recorded by the PsychoPy 'core', 
+    #   and stored in the CSV file 
+    # * trial start times as recorded by iohub (the PsychoPy submodule which 
+    #   handles the eyetracker) by means of messages sent by the PsychoPy 'core',
+    #   and stored in the HDF5 file
+    et_avg_offset = et_first_trial_start_times.mean() - psyp_first_trial_start_times.mean()
+    # shift the iohub/eyetracker data times by the average offset
+    et_df['time'] = et_time_arr - et_avg_offset
+
+    # =======================================
+    # INSERT 'CORE PSYCHOPY' DATA INTO 
+    # EYETRACKER DATA FRAME
+    # =======================================
+    # extract each trial's 'core PsychoPy' (CSV) output data. note 
+    # that in the CSV/psyp_df, each full row corresponds to one trial
+    trial_df = psyp_df.loc[psyp_stime_mask, CORE_INTERESTING_COLNAMES]
+    # label each trial's row with the index of its 'trial start' row 
+    # in et_df, and expand the trial data frame so that it has one
+    # (otherwise empty) row per eyetracker data frame row
+    trial_df.index = et_tstart_indices[:len(trial_df)]
+    trial_df = trial_df.reindex(et_df.index)
+
+    # insert the messages and the trial data into the eyetracker data
+    # frame all at once, forming a 'message' column and a column for
+    # each 'interesting' one in the 'core PsychoPy' data
+    et_df = pd.concat([et_df, et_messages, trial_df], axis=1)
+
+    # =======================================
+    # EXPORT COMBINED DATA TO CSV/PARQUET FILE
+    # =======================================
+    # form combined data file's name by replacing '.csv' with
+    # 'combined.csv' (or 'combined.parquet') in input CSV filename
+    output_fname = csv_fname.replace('.csv', f'_combined.{output_format}')
+    output_fpath = os.path.join(output_dir, output_fname)
+    if output_format == 'parquet':
+        et_df.to_parquet(output_fpath, index=False, compression='zstd')
     else:
-        return insert_index-1
+        et_df.to_csv(output_fpath, index=False)
 
 
 
-def reformat_data(exp_data_dir, output_dir):
+def reformat_data(exp_data_dir, output_dir, output_format='csv'):
     """
     Reformats PsychoPy data output, where each experiment run
     produces one CSV file and one HDF5 file, named according to
@@ -57,18 +346,28 @@ def reformat_data(exp_data_dir, output_dir):
     :param exp_data_dir: Full path to raw experiment output directory.
     :param output_dir: Full path to directory to output reformatted
     data to.
+    :param output_format: Format to output reformatted data in, either
+    'csv' or 'parquet' (the latter requires pyarrow).
     """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unknown output format '{output_format}', expected one of "
+            f"{OUTPUT_FORMATS}."
+        )
+
     # =======================================
     # FIND ALL DATA FILES
     # =======================================
-    # list all files & directories in data input directory,
-    # excluding hidden files
-    input_fnames = os.listdir(exp_data_dir)
-
-    # find names of all CSV and HDF5 files in the 
-    # data input directory
-    csv_fnames = [fname for fname in input_fnames if fname.endswith('csv')]
-    hdf5_fnames = [fname for fname in input_fnames if fname.endswith('hdf5')]
+    # go through all files & directories in data input directory
+    # once, finding names of all CSV and HDF5 files
+    csv_fnames = []
+    hdf5_fnames = []
+    with os.scandir(exp_data_dir) as dir_entries:
+        for entry in dir_entries:
+            if entry.name.endswith('.csv'):
+                csv_fnames.append(entry.name)
+            elif entry.name.endswith('.hdf5'):
+                hdf5_fnames.append(entry.name)
 
     # if no CSV files, or no HDF5 files, were found
     # (ie at least one of the lists is empty, 
@@ -107,183 +406,36 @@ def reformat_data(exp_data_dir, output_dir):
     hdf5_fnames.sort()
 
     # =======================================
-    # DEFINE RELEVANT 'CORE PSYCHOPY' COLUMNS
-    # =======================================
-    # define list of 'core PsychoPy' experiment output data columns 
-    # that are of interest for combining with/inserting into the
-    # eyetracker data frame (see below)
-    core_interesting_colnames = [
-        'att_grab_start_time_intended',
-        'gaze_to_audio_delay_intended',
-        'audio_to_visual_delay_intended',
-        'visual_duration_intended',
-        'end_blank_duration_intended',
-        'att_grab_start_time_actual',
-        'gaze_captured_time',
-        'audio_onset_time',
-        'visual_onset_time',
-        'visual_offset_time',
-        'trial_end_time',
-        'attention_sounds_played',
-        'visual_stimuli_duration_nframes',
-        'visual_social_prop',
-        'visual_geometric_prop',
-        'visual_manmade_prop',
-        'visual_natural_prop',
-        'visual_social_filepath',
-        'visual_social_pos_x',
-        'visual_social_pos_y',
-        'visual_geometric_filepath',
-        'visual_geometric_pos_x',
-        'visual_geometric_pos_y',
-        'visual_manmade_filepath',
-        'visual_manmade_pos_x',
-        'visual_manmade_pos_y',
-        'visual_natural_filepath',
-        'visual_natural_pos_x',
-        'visual_natural_pos_y',
-        'audio_filepath',
-        'audio_volume',
-    ]
-
-    # =======================================
-    # START LOOPING THROUGH FILES
+    # PROCESS FILES IN PARALLEL
     # =======================================
-    # loop through all of the CSV/HDF5 files and slightly correct
-    # and combine their data, then export results to one CSV
-    # file per set of experiment data
-    for csv_fname, et_hdf5_fname in zip(csv_fnames, hdf5_fnames):
-        et_hdf5_path = os.path.join(exp_data_dir, et_hdf5_fname)
-        csv_path = os.path.join(exp_data_dir, csv_fname)
-
-        # =======================================
-        # EXTRACT EYETRACKER DATA WITH H5PY
-        # =======================================
-        try:
-            h5f = h5py.File(et_hdf5_path)
-        except OSError as e:
-            raise CorruptHDF5Exception(
-                f"HDF5 file '{et_hdf5_path}' appears to be corrupt and cannot "
-                'be processed.'
-                f'(original exception: {e})'
+    # the data from each experiment run are independent of other 
+    # runs' data, so use a separate process for each CSV/HDF5 file
+    # pair, at most as many processes at a time as there are CPUs.
+    # each process gets an equal share of the memory that may be used
+    # for loading HDF5 files into memory
+    n_workers = min(len(csv_fnames), os.cpu_count() or 1)
+    core_driver_max_nbytes = H5_CORE_DRIVER_MAX_NBYTES // n_workers
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(
+                reformat_data_pair,
+                exp_data_dir,
+                output_dir,
+                csv_fname,
+                et_hdf5_fname,
+                output_format,
+                core_driver_max_nbytes,
             )
-
-        h5f_events = h5f['data_collection']['events']
-        # traverse hierarchical data structure to get at eye tracking data.
-        # check if 'mock' (using the mouse to simulate eyetracker gaze recording) 
-        # data are used (in which case 'monocular' events
-        # have been registered), or if actual data are used 
-        # (in which case 'BinocularEyeSampleEvent' have been registered,
-        # usually)
-        if 'BinocularEyeSampleEvent' in h5f_events['eyetracker'].keys():
-            eye_dataset = h5f_events['eyetracker']['BinocularEyeSampleEvent']
-        elif 'MonocularEyeSampleEvent' in h5f_events['eyetracker'].keys():
-            eye_dataset = h5f_events['eyetracker']['MonocularEyeSampleEvent']
-        else:
-            raise CorruptHDF5Exception(
-                f'HDF5 file {et_hdf5_path} appears to be corrupt and cannot '
-                'be processed.'
-            )
-        # traverse hierarchical data structure to get at data describing messages
-        # 'sent from PsychoPy', eg 'trial start' messages
-        message_dataset = h5f_events['experiment']['MessageEvent']
-
-        # convert eyetracker/message data to numpy arrays
-        eye_data_arr = np.array(eye_dataset)
-        message_data_arr = np.array(message_dataset)
-
-        # convert the eyetracker data numpy array to a pandas data frame
-        et_df = pd.DataFrame(eye_data_arr)
-        # convert 'messages' data numpy array to pandas data frame
-        msg_df = pd.DataFrame(message_data_arr)
-
-        # convert the 'messages' data frame's messages from 'byte' dtype
-        # to string literal dtype
-        msg_df['text'] = msg_df.text.str.decode('utf-8')
-
-        # add a 'message' column to the eyetracker data frame
-        et_df['message'] = np.nan
-
-        # for each recorded message, find the row in the 'et_df' which matches 
-        # most closely with regard to time of recording, and 
-        # insert the message into 'et_df'
-        for _, row in msg_df.iterrows():
-            closest_i = find_closest_index(et_df.time, row.time)
-            et_df.loc[closest_i, 'message'] = row.text
-
-        # close the connection to the hdf5 file
-        h5f.close()
-        
-        # =======================================
-        # LOAD 'CORE PSYCHOPY' EXPERIMENT DATA
-        # =======================================
-        # import psychopy experiment output data
-        # (stimuli onset times/file names/positions et c.)
-        psyp_df = pd.read_csv(csv_path)
-
-        # check if all of the necessary data columns are
-        # in the CSV file, and otherwise raise an error
-        for coln in (core_interesting_colnames + ['trial_global_start_time']):
-            if coln not in psyp_df.columns:
-                raise MissingColumnException((
-                    f"Missing column in CSV file '{csv_path}':\n"
-                    f"Could not find required column '{coln}'. "
-                    "Please double-check the data. "
-                    "If it's not possible to correct the CSV file, "
-                    "please move it, and its corresponding HDF5 file, "
-                    "to another directory and rerun the reformatting."
-                ))
-
-        # =======================================
-        # ADJUST EYETRACKER DATA TIMES
-        # =======================================
-        # find all correctly registered trial start times from CSV file
-        psyp_stime_mask = psyp_df.trial_global_start_time.notna()
-        psyp_first_trial_start_times = psyp_df.trial_global_start_time[psyp_stime_mask]
-        # find all correctly registered trial start times from eyetracker/HDF5 file
-        # (these are indicated by 'trial <trial_number> start' messages sent from PsychoPy to the
-        # submodule handling the eyetracker)
-        et_stime_mask = et_df.message.notna() & et_df.message.str.match('exp1 trial \d+ start')
-        et_first_trial_start_times = et_df.time[et_stime_mask]
-        # find the average offset between: 
-        # * trial start times as recorded by the PsychoPy 'core', 
-        #   and stored in the CSV file 
-        # * trial start times as recorded by iohub (the PsychoPy submodule which 
-        #   handles the eyetracker) by means of messages sent by the PsychoPy 'core',
-        #   and stored in the HDF5 file
-        et_avg_offset = et_first_trial_start_times.mean() - psyp_first_trial_start_times.mean()
-        # shift the iohub/eyetracker data times by the average offset
-        et_df.time = et_df.time - et_avg_offset
-
-        # =======================================
-        # INSERT 'CORE PSYCHOPY' DATA INTO 
-        # EYETRACKER DATA FRAME
-        # =======================================
-        # form an empty column in eyetracker data frame 
-        # for each 'interesting' one in the 'core PsychoPy' data
-        for coln in core_interesting_colnames:
-            et_df[coln] = np.nan
-
-        # get a list of indices for 'trial start' rows in et_df
-        et_tstart_indices = list(et_stime_mask[et_stime_mask].index)
-
-        trial_counter = 0
-
-        # for each trial, extract the trial's 'core PsychoPy' (CSV)
-        # output data and insert it into the eyetracker data frame
-        # at the row for 'trial start'. note that in the CSV/psyp_df,
-        # each full row corresponds to one trial
-        for _, row in psyp_df[psyp_stime_mask].iterrows():
-            et_i = et_tstart_indices[trial_counter]
-            for coln in core_interesting_colnames:
-                et_df.loc[et_i, coln] = row[coln]
-            trial_counter += 1
-        
-        # =======================================
-        # EXPORT COMBINED DATA TO CSV FILE
-        # =======================================
-        # form combined data file's name by replacing '.csv' with
-        # 'combined.csv' in input CSV filename
-        output_fname = csv_fname.replace('.csv', '_combined.csv')
-        output_fpath = os.path.join(output_dir, output_fname)
-        et_df.to_csv(output_fpath, index=False)
+            for csv_fname, et_hdf5_fname in zip(csv_fnames, hdf5_fnames)
+        ]
+        # go through the results in file name order, which raises any 
+        # exception (eg CorruptHDF5Exception) that occurred while 
+        # processing a file pair. in that case, cancel processing of
+        # all file pairs that haven't been started yet, so that the
+        # error is reported without waiting for them
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
@@ -1,4 +1,5 @@
 # python built-in packages
+import multiprocessing
 import tkinter as tk
 from tkinter import (
     filedialog, 
@@ -157,25 +158,30 @@ class Application(tk.Frame):
             return
         self.status_txt.set("Reformatting done!")
 
-root = tk.Tk()
+if __name__ == '__main__':
+    # needed for using multiple processes (see reformat_exp_data.py)
+    # in apps bundled with pyinstaller
+    multiprocessing.freeze_support()
 
-# define general layout
-root.title('REFORMAT EASE ET data')
+    root = tk.Tk()
 
-window_width = 600
-window_height = 400
+    # define general layout
+    root.title('REFORMAT EASE ET data')
 
-# get the screen dimension
-screen_width = root.winfo_screenwidth()
-screen_height = root.winfo_screenheight()
+    window_width = 600
+    window_height = 400
 
-# find the center point
-center_x = int(screen_width/2 - window_width / 2)
-center_y = int(screen_height/2 - window_height / 2)
+    # get the screen dimension
+    screen_width = root.winfo_screenwidth()
+    screen_height = root.winfo_screenheight()
 
-# set the position of the window to the center of the screen
-root.geometry(f'{window_width}x{window_height}+{center_x}+{center_y}')
+    # find the center point
+    center_x = int(screen_width/2 - window_width / 2)
+    center_y = int(screen_height/2 - window_height / 2)
 
+    # set the position of the window to the center of the screen
+    root.geometry(f'{window_width}x{window_height}+{center_x}+{center_y}')
 
-app = Application(master=root)
-app.mainloop()
+
+    app = Application(master=root)
+    app.mainloop()